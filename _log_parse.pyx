@@ -0,0 +1,169 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Optional C accelerated parse loop for log_analyzer.read_and_parse_log
+
+Build in place (requires Cython and a C compiler):
+
+    cythonize -i _log_parse.pyx
+"""
+
+from array import array
+
+from libc.stdlib cimport strtod
+from libc.string cimport memchr, memcmp
+
+cdef Py_ssize_t READ_SIZE = 1 << 20
+
+
+cdef inline bint is_digit(char c):
+    return 48 <= c <= 57  # '0'..'9'
+
+
+cdef bint parse_fast(const char *line, const char *eol,
+                     Py_ssize_t *url_start, Py_ssize_t *url_end, double *url_time):
+    """
+    Same fast path as log_analyzer.parse_log_line: locate the quoted request with memchr
+    and convert the last field with strtod. Returns False if the line needs the python fallback
+    """
+    cdef const char *q1
+    cdef const char *q2
+    cdef const char *p
+    cdef Py_ssize_t digits = 0, frac_digits = 0
+
+    if line == eol or not is_digit(line[0]):
+        return False
+    q1 = <const char *>memchr(line, 34, eol - line)  # '"'
+    if q1 == NULL:
+        return False
+    q2 = <const char *>memchr(q1 + 1, 34, eol - q1 - 1)
+    if q2 == NULL:
+        return False
+    p = <const char *>memchr(q1, 32, q2 - q1)  # ' '
+    if p == NULL:
+        return False
+    url_start[0] = p + 1 - line
+
+    p = q2 - 5
+    while p >= q1 and memcmp(p, b" HTTP", 5) != 0:
+        p -= 1
+    if p < q1 or p - line <= url_start[0]:
+        return False
+    url_end[0] = p - line
+
+    # request_time is the last field: [0-9]+\.[0-9]+ up to the end of line as in LOG_LINE_REGEXP
+    p = eol - 1
+    if p > line and p[0] == 13:  # '\r' of CRLF line
+        p -= 1
+    while p > line and is_digit(p[0]):
+        frac_digits += 1
+        p -= 1
+    if not frac_digits or p[0] != 46:  # '.'
+        return False
+    p -= 1
+    while p > line and is_digit(p[0]):
+        digits += 1
+        p -= 1
+    # the last field follows the quoted $http_X_RB_USER, otherwise the line is truncated
+    if p[0] != 32 or not digits or p - 1 <= q2 or (p - 1)[0] != 34:
+        return False
+    url_time[0] = strtod(p + 1, NULL)
+    return True
+
+
+cdef struct Counters:
+    Py_ssize_t line_count
+    Py_ssize_t error_count
+    Py_ssize_t total_request_count
+    double total_request_time
+
+
+cdef const char *parse_lines(const char *line, const char *end, bint eof, dict urls,
+                             parse_line, error_line, Counters *counters) except NULL:
+    """
+    Parse the lines of [line, end) buffer into urls
+    :return: start of the incomplete last line, which is left for the next buffer if not eof
+    """
+    cdef list url_stat
+    cdef Py_ssize_t url_start = 0, url_end = 0
+    cdef double url_time = 0
+    cdef const char *eol
+
+    while line < end:
+        eol = <const char *>memchr(line, 10, end - line)  # '\n'
+        if eol == NULL:
+            if not eof:
+                break
+            eol = end
+
+        if parse_fast(line, eol, &url_start, &url_end, &url_time):
+            url = line[url_start:url_end].decode('utf-8', 'replace')
+        else:
+            parsed = parse_line(line[:eol - line + (eol < end)].decode('utf-8', 'replace'))
+            if parsed:
+                url, url_time = parsed
+            else:
+                url = None
+                counters.error_count += 1
+                error_line(line[:eol - line + (eol < end)].decode('utf-8', 'replace'), counters.error_count)
+
+        if url is not None:
+            url_stat = urls.get(url)
+            if url_stat is None:
+                urls[url] = [1, url_time, url_time, array('d', (url_time,))]
+            else:
+                url_stat[0] += 1
+                url_stat[1] += url_time
+                if url_time > url_stat[2]:
+                    url_stat[2] = url_time
+                url_stat[3].append(url_time)
+            counters.total_request_time += url_time
+            counters.total_request_count += 1
+        counters.line_count += 1
+        line = eol + 1
+
+    return line if line < end else end
+
+
+def parse_stream(file, parse_line, error_line):
+    """
+    Parse binary log stream
+    :param file: file object opened in binary mode
+    :param parse_line: fallback for lines failed the fast path: str -> (url, request_time) or None
+    :param error_line: called for every broken line with (line, error_count)
+    :return: (urls, (line_count, error_count, total_request_count, total_request_time)),
+             urls values are [count, time_sum, time_max, array of request times]
+    """
+    cdef dict urls = {}
+    cdef Counters counters = Counters(0, 0, 0, 0)
+    cdef bytes buf, tail = b''
+    cdef const char *data
+    cdef const char *rest
+    cdef bint eof = False
+
+    while not eof:
+        chunk = file.read(READ_SIZE)
+        if chunk:
+            buf = tail + chunk
+        else:
+            buf = tail
+            eof = True
+        data = buf
+        rest = parse_lines(data, data + len(buf), eof, urls, parse_line, error_line, &counters)
+        tail = buf[rest - data:]
+
+    return urls, (counters.line_count, counters.error_count, counters.total_request_count, counters.total_request_time)
+
+
+def parse_buffer(const unsigned char[::1] buf, parse_line, error_line):
+    """
+    Parse the whole log at once from the buffer (mmap of plain log file or its memoryview slice) without copying
+    Arguments and result are the same as of parse_stream
+    """
+    cdef dict urls = {}
+    cdef Counters counters = Counters(0, 0, 0, 0)
+    cdef const char *data
+
+    if buf.shape[0]:
+        data = <const char *>&buf[0]
+        parse_lines(data, data + buf.shape[0], True, urls, parse_line, error_line, &counters)
+    return urls, (counters.line_count, counters.error_count, counters.total_request_count, counters.total_request_time)
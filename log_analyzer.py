@@ -6,34 +6,72 @@
 #                     '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
 #                     '$request_time';
 
-LOG_LINE_REGEXP = (r"^(?P<remote_host>[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}) +" 
-                  """(?P<remote_user>[^ ]+) +"""
-                  """(?P<http_x_real_ip>[^ ]+) +"""
-                  """(?P<time_local>\[[^\]]+\]) +"""
-                  """"[a-z]+ (?P<request>[^"]+) HTTP[^"]+" +"""
-                  """(?P<status>[^ ]+) +"""
-                  """(?P<body_bytes_sent>[^ ]+) +"""
-                  """"(?P<http_referer>[^"]+)" +"""
-                  """"(?P<http_user_agent>[^"]+)" +"""
-                  """"(?P<http_x_forwarded_for>[^"]+)" +"""
-                  """"(?P<http_X_REQUEST_ID>[^"]+)" +"""
-                  """"(?P<http_X_RB_USER>[^"]+)" +"""
-                  """(?P<request_time>[0-9]+\.[0-9]+)$""")
+# Only request and request_time are captured, other fields are matched by non-capturing groups
+LOG_LINE_REGEXP = (r"^(?:[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}) "  # remote_addr
+                   r"(?:[^ ]+) +"                                          # remote_user
+                   r"(?:[^ ]+) "                                           # http_x_real_ip
+                   r"(?:\[[^\]]+\]) "                                      # time_local
+                   r'"[A-Z]+ (?P<request>[^"]+) HTTP[^"]+" '               # request
+                   r"(?:[0-9]{3}) "                                        # status
+                   r"(?:[0-9]+) "                                          # body_bytes_sent
+                   r'"(?:[^"]+)" '                                         # http_referer
+                   r'"(?:[^"]+)" '                                         # http_user_agent
+                   r'"(?:[^"]+)" '                                         # http_x_forwarded_for
+                   r'"(?:[^"]+)" '                                         # http_X_REQUEST_ID
+                   r'"(?:[^"]+)" '                                         # http_X_RB_USER
+                   r"(?P<request_time>[0-9]+\.[0-9]+)\r?\n?$")             # request_time, re2 $ does not skip \n
 
 import os
 import re
 import sys
-import gzip
 import json
+import mmap
+import heapq
 import shutil
 import logging
-import operator
 import argparse
-import configparser
-from typing import Pattern
-from string import Template
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
 from datetime import datetime
-from collections import namedtuple
+from functools import lru_cache
+from itertools import chain
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from _log_parse import parse_buffer, parse_stream  # type: ignore  # optional C extension, see README
+except ImportError:
+    parse_buffer = parse_stream = None
+
+try:
+    from isal import igzip as gzip  # type: ignore  # ISA-L SIMD inflate, drop-in replacement of gzip module
+except ImportError:
+    import gzip  # type: ignore
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    import tomllib  # type: ignore
+except ImportError:  # python < 3.11
+    try:
+        import tomli as tomllib  # type: ignore
+    except ImportError:
+        tomllib = None  # type: ignore  # needed for --config only
+
+try:
+    import orjson  # type: ignore  # fast report serialization, writes bytes directly
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    import re2 as log_re  # type: ignore  # DFA based engine without backtracking, used for LOG_LINE_REGEXP only
+except ImportError:
+    log_re = re
+
+LOG_LINE_PATTERN = log_re.compile(LOG_LINE_REGEXP)
 
 
 config = {
@@ -47,7 +85,12 @@ config = {
 MAX_ERROR_COUNT = 100
 MAX_ERROR_PERCENT = 0.1
 FLOAT_PRECITION = 3
+MEDIAN_PARTITION_MIN_SIZE = 64  # shorter lists are sorted faster than converted to numpy array
+READ_CHUNK_SIZE = 1024 * 1024
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024  # plain logs bigger than this are parsed in parallel
+LOG_FILENAME_PREFIX = 'nginx-access-ui.log-'
 LogFile = namedtuple('LogFile', ['filename', 'date'])
+LogStat = namedtuple('LogStat', ['line_count', 'error_count', 'total_request_count', 'total_request_time'])
 SELF_LOG_FILENAME = './logfile.log'
 
 
@@ -62,29 +105,250 @@ def get_logger(is_logging_to_file=False, level=logging.DEBUG):
 
 def read_log(file):
     """
-    Iterator for reading file line by line
+    Iterator for reading binary file line by line
+    Reads the file by big chunks and decodes every chunk at once, lines are without trailing newline
     :param file:
     :return:
     """
+    return chain.from_iterable(read_log_chunks(file))
 
+
+def read_log_chunks(file):
+    """
+    Iterator over lists of lines of the binary file, one list per READ_CHUNK_SIZE chunk
+    """
+    tail = b''
     while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        data = tail + chunk
+        cut = data.rfind(b'\n') + 1
+        tail = data[cut:]
+        if cut:
+            yield data[:cut - 1].decode('utf-8', 'replace').split('\n')
+    if tail:
+        yield [tail.decode('utf-8', 'replace')]
+
+
+def parse_log_line(line: str, log_line_pattern=LOG_LINE_PATTERN) -> Optional[Tuple[str, float]]:
+    """
+    Extract request url and request_time from the log line.
+    Fast path locates the quoted request and the last field with str.find/rfind,
+    LOG_LINE_REGEXP is used only for lines which fail the fast path sanity checks
+    :return: (url, request_time) or None for the broken line
+    """
+    digit_led = '0' <= line[:1] <= '9'  # ASCII only, str.isdigit() accepts any unicode digit
+    q1 = line.find('"')
+    q2 = line.find('"', q1 + 1)
+    if digit_led and 0 < q1 < q2:
+        url_start = line.find(' ', q1, q2) + 1
+        url_end = line.rfind(' HTTP', q1, q2)
+        # request_time must follow the quoted $http_X_RB_USER, otherwise the line is truncated
+        # (e.g. right after the status)
+        time_start = line.rfind(' ') + 1
+        if 0 < url_start < url_end and q2 < time_start - 2 and line[time_start - 2] == '"':
+            # [0-9]+\.[0-9]+ as in LOG_LINE_REGEXP: float() alone accepts -1, .5, 5., inf, nan, 1e5, 1_0
+            time_str = line[time_start:].rstrip('\r\n')
+            int_part, dot, frac_part = time_str.partition('.')
+            if dot and int_part.isdigit() and frac_part.isdigit() and time_str.isascii():
+                return line[url_start:url_end], float(time_str)
+
+    # cheap prefilter, most of broken lines never reach the regex:
+    # it needs the digit-led remote_addr, six quoted fields (12 quotes at least) and the HTTP protocol
+    if not digit_led or line.count('"') < 12 or ' HTTP' not in line:
+        return None
+    matches = log_line_pattern.match(line)
+    if matches is not None:
+        url, url_time = matches.groups()  # (request, request_time): positional, no group name lookups
+        return url, float(url_time)
+    return None
+
+
+def error_line(line: str, error_count: int) -> None:
+    """
+    Log the broken line, stop parsing if there are too many of them
+    """
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug('Error line: %s', line)
+    if error_count > MAX_ERROR_COUNT:
+        raise RuntimeError('Too many error lines in log file - %d' % error_count, logging.ERROR)
+
+
+def new_url_stat() -> list:
+    """
+    Empty url statistics: [count, time_sum, time_max, array of request times]
+    """
+    return [0, 0.0, 0.0, array('d')]
+
+
+def parse_lines(lines: Iterable[str], log_line_pattern=LOG_LINE_PATTERN) -> Tuple[Dict[str, list], LogStat]:
+    """
+    Collect request times by url from the log lines
+    :return: (urls, LogStat), urls values are [count, time_sum, time_max, array of request times]
+    """
+    urls: Dict[str, list] = defaultdict(new_url_stat)
+    line_count = error_count = total_request_count = 0
+    total_request_time = 0.0
+    # bind globals to locals: LOAD_FAST instead of the dict lookups in the loop
+    parse, report_error = parse_log_line, error_line
+    for line in lines:
+        parsed = parse(line, log_line_pattern)
+        if parsed is not None:
+            url, url_time = parsed
+            url_stat = urls[url]
+            url_stat[0] += 1
+            url_stat[1] += url_time
+            if url_time > url_stat[2]:
+                url_stat[2] = url_time
+            url_stat[3].append(url_time)
+            total_request_time += url_time
+            total_request_count += 1
+        else:
+            error_count += 1
+            report_error(line, error_count)
+        line_count += 1
+
+    return urls, LogStat(line_count, error_count, total_request_count, total_request_time)
+
+
+def split_log(logname, parts):
+    """
+    Split plain log file to byte ranges aligned to the line boundaries
+    :return: list of (start, end)
+    """
+    size = os.path.getsize(logname)
+    bounds = [0]
+    with open(logname, 'rb') as file:
+        for i in range(1, parts):
+            file.seek(max(size * i // parts, bounds[-1]))
+            file.readline()
+            bounds.append(min(file.tell(), size))
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_log_range(file: BinaryIO, start: int, end: int) -> Iterator[str]:
+    """
+    Iterator for reading lines of binary file between start and end byte offsets
+    """
+    file.seek(start)
+    while start < end:
         line = file.readline()
         if not line:
             break
-        yield line
+        start += len(line)
+        yield line.decode('utf-8', 'replace')
+
+
+def parse_log_map(file: BinaryIO, start: int = 0, end: Optional[int] = None) -> Tuple[Dict[str, list], LogStat]:
+    """
+    Parse the byte range of the plain log file with _log_parse C extension
+    The file is memory mapped and scanned in place, without copying it through the read buffers
+    :param end: end offset, None - till the end of file
+    :return: (urls, LogStat)
+    """
+    if os.fstat(file.fileno()).st_size == 0:
+        return {}, LogStat(0, 0, 0, 0)  # empty file can't be mapped
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+        if hasattr(log_map, 'madvise'):
+            log_map.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(log_map) as view, view[start:end] as log_range:
+            urls, stat = parse_buffer(log_range, parse_log_line, error_line)
+    return urls, LogStat(*stat)
+
+
+def parse_log_range(logname: str, start: int, end: int) -> Tuple[Dict[str, list], LogStat]:
+    """
+    Worker: parse the byte range of the plain log file, with _log_parse C extension if it is built
+    :return: (urls, LogStat)
+    """
+    with open(logname, 'rb') as file:
+        if parse_buffer is not None:
+            return parse_log_map(file, start, end)
+        return parse_lines(read_log_range(file, start, end))
+
+
+def merge_parsed(results):
+    """
+    Merge (urls, LogStat) of the log parts keeping the order of request times
+    """
+    urls = {}
+    line_count = error_count = total_request_count = total_request_time = 0
+    for part_urls, part_stat in results:
+        for url, part_stat_url in part_urls.items():
+            url_stat = urls.get(url)
+            if url_stat is None:
+                urls[url] = part_stat_url
+            else:
+                url_stat[0] += part_stat_url[0]
+                url_stat[1] += part_stat_url[1]
+                url_stat[2] = max(url_stat[2], part_stat_url[2])
+                url_stat[3].extend(part_stat_url[3])
+        line_count += part_stat.line_count
+        error_count += part_stat.error_count
+        total_request_count += part_stat.total_request_count
+        total_request_time += part_stat.total_request_time
+
+    if error_count > MAX_ERROR_COUNT:
+        raise RuntimeError('Too many error lines in log file - %d' % error_count, logging.ERROR)
+    return urls, LogStat(line_count, error_count, total_request_count, total_request_time)
+
+
+def read_and_parse_log(logname: str) -> Tuple[Dict[str, list], LogStat]:
+    """
+    Read log file (plain or .gz) and collect request times by url
+    Big plain logs are parsed by all CPU cores, otherwise _log_parse C extension is used if it is built
+    :return: (urls, LogStat)
+    """
+    open_log = gzip.open if logname.endswith('.gz') else open
+
+    # CPUs available to the process (affinity, container cpuset), not all CPUs of the host
+    if hasattr(os, 'sched_getaffinity'):
+        workers = len(os.sched_getaffinity(0))
+    else:
+        workers = os.cpu_count() or 1
+    if open_log is open and workers > 1 and os.path.getsize(logname) > PARALLEL_MIN_SIZE:
+        starts, ends = zip(*split_log(logname, workers))
+        with ProcessPoolExecutor(workers) as executor:
+            return merge_parsed(executor.map(parse_log_range, [logname] * workers, starts, ends))
+
+    if parse_stream is not None:
+        with open_log(logname, 'rb') as file:
+            if open_log is open:
+                return parse_log_map(file)
+            urls, stat = parse_stream(file, parse_log_line, error_line)
+        return urls, LogStat(*stat)
+
+    # chunked reading pays off for gzip stream only, TextIOWrapper iteration is faster on plain files
+    if open_log is open:
+        with open(logname, 'rt', encoding='utf-8', errors='replace') as file:
+            return parse_lines(file)
+    with gzip.open(logname, 'rb') as file:
+        return parse_lines(read_log(file))
 
 
 def median(lst):
     """
     Calculates list mediana
+    Uses O(n) numpy.partition selection instead of the full sort for long lists if numpy is installed
     """
     n = len(lst)
     if n < 1:
-            return None
-    if n % 2 == 1:
-            return sorted(lst)[n//2]
-    else:
-            return sum(sorted(lst)[n//2-1:n//2+1])/2.0
+        return None
+    if np is not None and n >= MEDIAN_PARTITION_MIN_SIZE:
+        a = np.asarray(lst, dtype=np.float64)
+        k = n // 2
+        if n % 2 == 1:
+            return float(np.partition(a, k)[k])
+        # one partition call places both middle elements
+        a = np.partition(a, (k - 1, k))
+        return float(0.5 * (a[k - 1] + a[k]))
+    s = sorted(lst)
+    k = n // 2
+    if n & 1:
+        return s[k]
+    return (s[k - 1] + s[k]) * 0.5
 
 
 def prepare_report_dir(report_dir):
@@ -120,56 +384,128 @@ def get_last_log_filename(log_dir):
     """
     log_filename = ''
     last_log_date = 0
-    log_file_regexp = re.compile(r"""^nginx-access-ui.log-(?P<date>[0-9]{8})(.gz)?""")  # type: Pattern[str]
+    prefix_len = len(LOG_FILENAME_PREFIX)
     if not os.path.isdir(log_dir):
         raise FileNotFoundError('Directory "%s" is not found!' % log_dir)
 
     for dir_entry in os.scandir(log_dir):
-        if dir_entry.is_file() and dir_entry.name.startswith('nginx-access-ui.log-'):
-            matched = log_file_regexp.match(dir_entry.name)
-            if matched and int(matched.group('date')) > last_log_date:
-                last_log_date = int(matched.group('date'))
-                log_filename = dir_entry.path
+        if not dir_entry.name.startswith(LOG_FILENAME_PREFIX):
+            continue
+        # plain string checks instead of regexp: <prefix><8 digits>[.gz]
+        date_str = dir_entry.name[prefix_len:prefix_len + 8]
+        if len(date_str) != 8 or not (date_str.isascii() and date_str.isdecimal()) or dir_entry.name[prefix_len + 8:] not in ('', '.gz'):
+            continue
+        log_date = int(date_str)
+        # is_file() may cost a stat call, so it is checked last and for the newer logs only
+        if log_date > last_log_date and dir_entry.is_file():
+            last_log_date = log_date
+            log_filename = dir_entry.path
     if not log_filename:
         raise RuntimeError('Nginx log files not found in %s' % log_dir, logging.INFO)
     return LogFile(filename=log_filename, date=last_log_date)
 
 
-def calculate_statistics(urls, total_request_count, total_request_time):
-
-    statistic = []
-    # noinspection PyDictCreation
-    for url, url_time in urls.items():
-        url_stat = {'url': url,
-                    'count': len(url_time),
-                    'time_sum': round(sum(url_time), FLOAT_PRECITION)}
-
-        # count percent
-        url_stat['count_perc'] = round(100 * url_stat['count'] / total_request_count, FLOAT_PRECITION)
+def calculate_statistics(urls, total_request_count, total_request_time, report_size):
+    """
+    Statistics of top report_size urls by time_sum, sorted by time_sum desc
+    Median and the other values are calculated for these urls only
+    """
 
-        # time_sum percent
-        url_stat['time_perc'] = round(100 * url_stat['time_sum'] / total_request_time, FLOAT_PRECITION)
+    # time_sum is rounded before the derived values, as the report always did;
+    # url makes the order stable for unittests
+    top_urls = heapq.nlargest(report_size, ((round(url_stat[1], FLOAT_PRECITION), url)
+                                            for url, url_stat in urls.items()))
+    counts = [urls[url][0] for _, url in top_urls]
+    time_sums = [time_sum for time_sum, _ in top_urls]
 
-        # time avg, max, med
-        url_stat['time_avg'] = round(url_stat['time_sum'] / url_stat['count'], FLOAT_PRECITION)
-        url_stat['time_max'] = round(max(url_time), FLOAT_PRECITION)
-        url_stat['time_med'] = round(median(url_time), FLOAT_PRECITION)
+    # count percent, time_sum percent, time avg: plain python for report_size rows only.
+    # All request times may be 0.000, then every url has 0% of the time
+    count_percs = [100 * count / total_request_count for count in counts]
+    time_percs = [100 * time_sum / total_request_time if total_request_time else 0.0 for time_sum in time_sums]
+    time_avgs = [time_sum / count for time_sum, count in zip(time_sums, counts)]
 
-        statistic.append(url_stat)
+    # only the top rows are built, so each row dict is created once with the report values
+    statistic = []
+    for (time_sum, url), count, count_perc, time_perc, time_avg in \
+            zip(top_urls, counts, count_percs, time_percs, time_avgs):
+        _, _, time_max, url_time = urls[url]
+        # keys are in sorted order, so the report JSON needs no sort_keys
+        statistic.append({'count': count,
+                          'count_perc': round(count_perc, FLOAT_PRECITION),
+                          'time_avg': round(time_avg, FLOAT_PRECITION),
+                          'time_max': round(time_max, FLOAT_PRECITION),
+                          'time_med': round(median(url_time), FLOAT_PRECITION),
+                          'time_perc': round(time_perc, FLOAT_PRECITION),
+                          'time_sum': time_sum,
+                          'url': url})
     return statistic
 
 
-def write_report(report_filename, statistic, report_size):
+@lru_cache(maxsize=None)
+def load_report_template(template_filename):
+    """
+    Read the report template once and split it at $table_json, the only placeholder
+    :param template_filename: absolute path, so the cached value does not depend on the working dir
+    :return: (head, tail) encoded to utf-8
+    """
     try:
-        with open('./report.html', 'rt', encoding='utf-8') as log:
-            tpl_string = log.read()
+        with open(template_filename, 'rt', encoding='utf-8') as template:
+            tpl_string = template.read()
     except FileNotFoundError:
         raise RuntimeError('File report.html not found', logging.ERROR)
+    tpl_head, _, tpl_tail = tpl_string.partition('$table_json')
+    return tpl_head.encode('utf-8'), tpl_tail.encode('utf-8')
+
+
+def write_report(report_filename, statistic, report_size):
+    # template parts and the table JSON (report_size rows, serialized in memory) are written one after another,
+    # without building the whole report string. Temp file is renamed to the report atomically, so the interrupted run leaves no broken report
+    tpl_head, tpl_tail = load_report_template(os.path.abspath('./report.html'))
+    rows = statistic[:report_size]
+    if orjson is not None:
+        table_json = orjson.dumps(rows)
+    else:
+        # same compact utf-8 output as orjson, so the report does not depend on installed packages
+        table_json = json.dumps(rows, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    temp_filename = report_filename + '.tmp'
+    try:
+        with open(temp_filename, 'wb') as log:
+            log.write(tpl_head)
+            log.write(table_json)
+            log.write(tpl_tail)
+        os.replace(temp_filename, report_filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def load_config(config_filename, defaults):
+    """
+    Read TOML config file, values come typed, so no casting is needed
+    :param config_filename: path to the config file
+    :param defaults: default config, options of the file must be its top-level keys of the same types
+    :return: dict of config options
+    """
+    if tomllib is None:
+        raise RuntimeError('Reading config file requires python 3.11+ or tomli package', logging.ERROR)
+    with open(config_filename, 'rb') as file:
+        try:
+            file_config = tomllib.load(file)
+        except tomllib.TOMLDecodeError as err:
+            raise RuntimeError('Incorrect config file %s: %s' % (config_filename, err), logging.ERROR)
+
+    for key, value in file_config.items():
+        if key not in defaults:
+            raise RuntimeError('Unknown option "%s" in config file %s (options are top-level keys, '
+                               'no [config] table)' % (key, config_filename), logging.ERROR)
+        # bool is int subclass, so the exact type is compared
+        if type(value) is not type(defaults[key]):
+            raise RuntimeError('Option "%s" in config file %s must be %s, not %s'
+                               % (key, config_filename, type(defaults[key]).__name__, type(value).__name__),
+                               logging.ERROR)
+    return file_config
 
-    s = Template(tpl_string)
-    report_string = s.safe_substitute(table_json=json.dumps(statistic[:report_size], sort_keys=True)) # , indent=4
-    with open(report_filename, 'wt+', encoding='utf-8') as log:
-        log.write(report_string)
 
 def main():
 
@@ -183,26 +519,22 @@ def main():
         args = parser.parse_args()
 
         logger.info('Config section')
-        configfile = configparser.ConfigParser(config)
-        configfile.optionxform = str
         if args.config:
-            configfile.read(args.config)
-            configfile_dict = dict(configfile._sections['config'])
             # Overwriting config options from file
-            config.update(configfile_dict)
-            config['REPORT_SIZE'] = int(config['REPORT_SIZE'])
-            logger.info('Using config: %s' % args.config)
+            config.update(load_config(args.config, config))
+            logger.info('Using config: %s', args.config)
         else:
             logger.info('Using default config')
         logger.debug(config)
 
         logger.info('Searching fresh log file...')
         logfile = get_last_log_filename(config["LOG_DIR"])
-        logger.info('Last log found: %s' % logfile.filename)
+        logger.info('Last log found: %s', logfile.filename)
 
         logger.info('Parsing log filename and build report filename, creating report directory if not exists')
         try:
-            report_dt = datetime.strptime(str(logfile.date), "%Y%m%d")
+            # YYYYMMDD int, datetime() validates it as strptime did without the format parsing
+            report_dt = datetime(logfile.date // 10000, logfile.date // 100 % 100, logfile.date % 100)
         except ValueError:
             raise RuntimeError('Incorrect date in the log filename: ' + logfile.filename, logging.ERROR)
 
@@ -210,38 +542,15 @@ def main():
         report_filename = build_report_filepath(config['REPORT_DIR'], report_dt)
 
         logger.info('Reading and analyzing log file...')
-        urls = {}
-        line_count = error_count = total_request_count = total_request_time = 0
-        log_line_pattern = re.compile(LOG_LINE_REGEXP, re.IGNORECASE)
-        logname = logfile.filename
-        with (gzip.open if logname.endswith('.gz') else open)(logname, 'rt', encoding='utf-8') as file:
-
-            for line in read_log(file):
-                matches = log_line_pattern.match(line)
-                if matches:
-                    url = matches.group("request")
-                    url_time = float(matches.group("request_time"))
-                    if url not in urls:
-                        urls[url] = []
-                    urls[url].append(url_time)
-                    total_request_time += url_time
-                    total_request_count += 1
-                else:
-                    error_count += 1
-                    logger.debug('Error line: %s' % line)
-                    if error_count > MAX_ERROR_COUNT:
-                        raise RuntimeError('Too many error lines in log file - $s' % error_count, logging.ERROR)
-                line_count += 1
-                # if line_count >= 500: break # limit for test
-
-        logger.info('Total parsed lines: %d, error lines: %d' % (total_request_count, error_count))
-        if line_count and error_count/line_count > MAX_ERROR_PERCENT:
-            raise RuntimeError('Too many error lines (%.2f%%) in the log file' % (100*error_count/line_count), logging.ERROR)
+        urls, stat = read_and_parse_log(logfile.filename)
+        logger.info('Total parsed lines: %d, error lines: %d', stat.total_request_count, stat.error_count)
+        if stat.line_count and stat.error_count/stat.line_count > MAX_ERROR_PERCENT:
+            raise RuntimeError('Too many error lines (%.2f%%) in the log file' % (100*stat.error_count/stat.line_count),
+                               logging.ERROR)
 
         logger.info('Calculating statistics...')
-        statistic = calculate_statistics(urls, total_request_count, total_request_time)
-        # statistic.sort(key=lambda k: k['time_sum'], reverse=True)
-        statistic.sort(key=operator.itemgetter('time_sum', 'url'), reverse=True) # to make sorting stable for unittests
+        statistic = calculate_statistics(urls, stat.total_request_count, stat.total_request_time,
+                                         config['REPORT_SIZE'])
 
         logger.info('Writing report file: %s', report_filename)
         write_report(report_filename, statistic, config['REPORT_SIZE'])
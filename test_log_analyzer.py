@@ -4,7 +4,11 @@
 import unittest
 import log_analyzer
 import os
+import gzip
+import random
 import filecmp
+import tempfile
+import statistics
 
 
 class TestLogAnalyzer(unittest.TestCase):
@@ -35,6 +39,120 @@ class TestLogAnalyzer(unittest.TestCase):
         filecmp.clear_cache()
         self.assertTrue(filecmp.cmp(self.source_path, self.report_path), 'Report file is not equal to sample Report!')
 
+    def test_parse_log_line(self):
+
+        line = '1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/v2/banner/25019354 HTTP/1.1" 200 927 ' \
+               '"-" "Lynx/2.8.8dev.9 libwww-FM/2.14" "-" "1498697422-2190034393-4708-9752759" "dc7161be3" 0.390\n'
+        self.assertEqual(log_analyzer.parse_log_line(line), ('/api/v2/banner/25019354', 0.39))
+        self.assertIsNone(log_analyzer.parse_log_line('garbage line\n'))
+        self.assertIsNone(log_analyzer.parse_log_line(line.replace('0.390', '-')))
+        self.assertIsNone(log_analyzer.parse_log_line(line.replace('0.390', '-0.390')))
+        # regex fallback gets the lines with trailing newline, re2 $ does not match before it
+        self.assertEqual(log_analyzer.LOG_LINE_PATTERN.match(line).groups(), ('/api/v2/banner/25019354', '0.390'))
+        for request_time in ['inf', '.390', '5.', '1e5', '1_0.390']:
+            self.assertIsNone(log_analyzer.parse_log_line(line.replace('0.390', request_time)))
+        self.assertIsNone(log_analyzer.parse_log_line(line[:line.index(' 927 ')] + '\n'))
+        self.assertIsNone(log_analyzer.parse_log_line('\uff11' + line[1:]))  # full-width digit
+
+    def test_parse_log_ranges(self):
+
+        with gzip.open(os.path.join(log_analyzer.config['LOG_DIR'], 'nginx-access-ui.log-20180101.gz'), 'rb') as gz, \
+                tempfile.NamedTemporaryFile(suffix='.log', delete=False) as plain:
+            plain.write(gz.read())
+        try:
+            with open(plain.name, 'rt', encoding='utf-8') as file:
+                urls, stat = log_analyzer.parse_lines(file)
+            ranges = log_analyzer.split_log(plain.name, 7)
+            part_urls, part_stat = log_analyzer.merge_parsed(log_analyzer.parse_log_range(plain.name, start, end)
+                                                             for start, end in ranges)
+        finally:
+            os.remove(plain.name)
+        self.assertEqual(part_urls.keys(), urls.keys())
+        for url, (count, time_sum, time_max, url_time) in urls.items():
+            self.assertEqual(part_urls[url][0], count)
+            self.assertAlmostEqual(part_urls[url][1], time_sum)
+            self.assertEqual(part_urls[url][2], time_max)
+            self.assertEqual(part_urls[url][3], url_time)
+        self.assertEqual(part_stat.line_count, stat.line_count)
+        self.assertEqual(part_stat.total_request_count, stat.total_request_count)
+
+    def test_read_invalid_utf8(self):
+
+        line = b'1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/\xff HTTP/1.1" 200 927 ' \
+               b'"-" "Lynx/2.8.8dev.9 libwww-FM/2.14" "-" "1498697422-2190034393-4708-9752759" "dc7161be3" 0.390\n'
+        for suffix, open_log in [('.log', open), ('.gz', gzip.open)]:
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as log:
+                pass
+            try:
+                with open_log(log.name, 'wb') as file:
+                    file.write(line)
+                urls, stat = log_analyzer.read_and_parse_log(log.name)
+            finally:
+                os.remove(log.name)
+            self.assertEqual(list(urls), ['/api/\ufffd'])
+            self.assertEqual(stat.error_count, 0)
+
+    def test_read_crlf(self):
+
+        line = b'1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/v2/banner/25019354 HTTP/1.1" 200 927 ' \
+               b'"-" "Lynx/2.8.8dev.9 libwww-FM/2.14" "-" "1498697422-2190034393-4708-9752759" "dc7161be3" 0.390\r\n'
+        # remote_user with a quote fails the fast path, so the last line goes to the regex fallback
+        fallback_line = line.replace(b' -  - ', b' "-"  - ')
+        for suffix, open_log in [('.log', open), ('.gz', gzip.open)]:
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as log:
+                pass
+            try:
+                with open_log(log.name, 'wb') as file:
+                    file.write(line * 2 + fallback_line)
+                urls, stat = log_analyzer.read_and_parse_log(log.name)
+            finally:
+                os.remove(log.name)
+            self.assertEqual(stat.error_count, 0)
+            self.assertEqual(stat.total_request_count, 3)
+            self.assertAlmostEqual(urls['/api/v2/banner/25019354'][1], 3 * 0.39)
+
+    @unittest.skipIf(log_analyzer.np is None, 'numpy is not installed')
+    def test_median(self):
+
+        # numpy.partition is used from MEDIAN_PARTITION_MIN_SIZE, shorter lists are sorted
+        for n in [5, 6, log_analyzer.MEDIAN_PARTITION_MIN_SIZE, log_analyzer.MEDIAN_PARTITION_MIN_SIZE + 1, 1000, 1001]:
+            url_time = log_analyzer.array('d', (random.random() for _ in range(n)))
+            self.assertEqual(log_analyzer.median(url_time), statistics.median(url_time), n)
+
+    def test_calculate_statistics_zero_time(self):
+
+        urls = {'/api/1': [2, 0.0, 0.0, log_analyzer.array('d', [0.0, 0.0])]}
+        statistic = log_analyzer.calculate_statistics(urls, 2, 0.0, 10)
+        self.assertEqual(statistic, [{'count': 2, 'count_perc': 100.0, 'time_avg': 0.0, 'time_max': 0.0,
+                                      'time_med': 0.0, 'time_perc': 0.0, 'time_sum': 0.0, 'url': '/api/1'}])
+
+    def test_get_last_log_filename(self):
+
+        with tempfile.TemporaryDirectory() as log_dir:
+            for name in ['nginx-access-ui.log-20170630.gz', 'nginx-access-ui.log-20170701',
+                         'nginx-access-ui.log-20180101.bz2', 'nginx-access-ui.log-2018010', 'nginx-test-ui.log-20190101',
+                         'nginx-access-ui.log-\uff12\uff10\uff11\uff19\uff10\uff11\uff10\uff11']:
+                open(os.path.join(log_dir, name), 'w').close()
+            os.mkdir(os.path.join(log_dir, 'nginx-access-ui.log-20190101'))
+            logfile = log_analyzer.get_last_log_filename(log_dir)
+        self.assertEqual(logfile, log_analyzer.LogFile(os.path.join(log_dir, 'nginx-access-ui.log-20170701'), 20170701))
+
+    def test_load_config(self):
+
+        with tempfile.TemporaryDirectory() as config_dir:
+            config_filename = os.path.join(config_dir, 'conf.toml')
+            with open(config_filename, 'w') as file:
+                file.write('REPORT_SIZE = 20\nLOG_DIR = "./log_dir"\nLOGGING_TO_FILE = false\n')
+            self.assertEqual(log_analyzer.load_config(config_filename, log_analyzer.config),
+                             {'REPORT_SIZE': 20, 'LOG_DIR': './log_dir', 'LOGGING_TO_FILE': False})
+
+            for content in ['REPORT_SIZE: 20\n', '[config]\nREPORT_SIZE = 20\n', 'REPORT_SIZE = "20"\n',
+                            'LOGGING_TO_FILE = 1\n']:
+                with open(config_filename, 'w') as file:
+                    file.write(content)
+                with self.assertRaises(RuntimeError):
+                    log_analyzer.load_config(config_filename, log_analyzer.config)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file